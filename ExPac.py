@@ -1,7 +1,18 @@
+import contextlib
+import mmap
 import os
 import sys
 import struct
-from typing import List, Optional
+from typing import List, Optional, Tuple
+
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_NIBBLE_SWAP = bytes((b >> 4) | ((b & 0x0F) << 4) for b in range(256))
+_S16 = struct.Struct("<h")
+_U32 = struct.Struct("<I")
+_S64 = struct.Struct("<q")
+# entry signature blob: u32 magic, s16 at +4, u32 at +6
+_SIG = struct.Struct("<IhI")
 
 class Entry:
     def __init__(self):
@@ -16,45 +27,62 @@ class Entry:
 class ArcView:
     def __init__(self, file_path: str):
         self.file = open(file_path, "rb")
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # mmap can fail on some platforms/filesystems (and on empty
+            # files); fall back to one bulk read. unpack_from and slicing
+            # work the same on bytes, so the rest of the class is unchanged.
+            self.file.seek(0)
+            self.mm = self.file.read()
         self.max_offset = os.path.getsize(file_path)
 
     def read_int16(self, offset: int) -> int:
-        self.file.seek(offset)
-        return struct.unpack("<h", self.file.read(2))[0]
+        return _S16.unpack_from(self.mm, offset)[0]
 
     def read_byte(self, offset: int) -> int:
-        self.file.seek(offset)
-        return struct.unpack("<B", self.file.read(1))[0]
+        return _U8.unpack_from(self.mm, offset)[0]
 
     def read_uint32(self, offset: int) -> int:
-        self.file.seek(offset)
-        return struct.unpack("<I", self.file.read(4))[0]
+        return _U32.unpack_from(self.mm, offset)[0]
 
     def read_int64(self, offset: int) -> int:
-        self.file.seek(offset)
-        return struct.unpack("<q", self.file.read(8))[0]
+        return _S64.unpack_from(self.mm, offset)[0]
 
     def read_string(self, offset: int, length: int) -> str:
-        self.file.seek(offset)
-        return self.file.read(length).decode('utf-8').rstrip('\x00')
+        return self.mm[offset:offset+length].rstrip(b'\x00').decode('utf-8')
 
     def read_bytes(self, offset: int, size: int) -> bytes:
-        self.file.seek(offset)
-        return self.file.read(size)
+        return self.mm[offset:offset+size]
+
+    def close(self) -> None:
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.file.close()
+
+    def copy_to(self, offset: int, size: int, out) -> None:
+        chunk = 1 << 20
+        mv = memoryview(self.mm)
+        end = offset + size
+        for pos in range(offset, end, chunk):
+            out.write(mv[pos:min(pos + chunk, end)])
 
 def is_sane_count(count: int) -> bool:
     return 0 < count < 0x10000
 
-def try_open(file_path: str) -> Optional[List[Entry]]:
+def try_open(file_path: str) -> Optional[Tuple[ArcView, List[Entry]]]:
     view = ArcView(file_path)
     count = view.read_int16(0)
     if not is_sane_count(count):
+        view.close()
         return None
     name_length = view.read_byte(2)
     if name_length == 0:
+        view.close()
         return None
     data_offset = view.read_uint32(3)
     if data_offset >= view.max_offset:
+        view.close()
         return None
 
     index_size = 7 + (name_length + 8) * count
@@ -63,44 +91,46 @@ def try_open(file_path: str) -> Optional[List[Entry]]:
     elif data_offset == index_size + 4 * count:
         version = 2
     else:
+        view.close()
         return None
 
+    if version == 1:
+        record = struct.Struct(f"<{name_length}sII")
+    else:
+        record = struct.Struct(f"<{name_length}sqI")
+    index = view.read_bytes(7, record.size * count)
+
     dir_entries = []
-    index_offset = 7
-    for i in range(count):
-        name = view.read_string(index_offset, name_length)
-        index_offset += name_length
+    for name_bytes, offset, size in record.iter_unpack(index):
         entry = Entry()
-        entry.name = name
-        if version == 1:
-            entry.offset = view.read_uint32(index_offset) + data_offset
-            entry.size = view.read_uint32(index_offset + 4)
-            index_offset += 8
-        else:
-            entry.offset = view.read_int64(index_offset) + data_offset
-            entry.size = view.read_uint32(index_offset + 8)
-            index_offset += 12
+        entry.name = name_bytes.rstrip(b'\x00').decode('utf-8')
+        entry.offset = offset + data_offset
+        entry.size = size
         if not entry.check_placement(view.max_offset):
+            view.close()
             return None
         dir_entries.append(entry)
 
     arc_name = os.path.splitext(os.path.basename(file_path))[0].lower()
     for entry in dir_entries:
-        signature = view.read_uint32(entry.offset)
+        blob = view.read_bytes(entry.offset, _SIG.size)
+        if len(blob) < _SIG.size:
+            continue
+        signature, magic6, magic140050 = _SIG.unpack(blob)
         if signature == 0x5367674F:  # 'OggS'
             entry.name = os.path.splitext(entry.name)[0] + ".ogg"
             entry.type = "audio"
         elif ((signature & 0xFF) == 1 or (signature & 0xFF) == 2) and "grd" in arc_name:
             entry.name = os.path.splitext(entry.name)[0] + ".grd"
             entry.type = "image"
-        elif (signature & 0xFF) == 0x44 and entry.size - 9 == view.read_uint32(entry.offset + 5):
+        elif (signature & 0xFF) == 0x44 and entry.size - 9 == _U32.unpack_from(blob, 5)[0]:
             entry.type = "audio"
-        elif view.read_int16(entry.offset + 4) == 6 and view.read_uint32(entry.offset + 6) == 0x140050:
+        elif magic6 == 6 and magic140050 == 0x140050:
             entry.type = "script"
             if arc_name == "srp":
                 entry.name = os.path.splitext(entry.name)[0] + ".srp"
 
-    return dir_entries
+    return view, dir_entries
 
 def open_entry(view: ArcView, entry: Entry) -> bytes:
     if entry.type != "script" or view.read_int16(entry.offset + 4) != 6 or view.read_uint32(entry.offset + 6) != 0x140050:
@@ -112,13 +142,12 @@ def open_entry(view: ArcView, entry: Entry) -> bytes:
     for i in range(record_count):
         if pos + 2 > len(data):
             break
-        chunk_size = struct.unpack("<H", data[pos:pos+2])[0] - 4
+        chunk_size = _U16.unpack_from(data, pos)[0] - 4
         pos += 6
         if pos + chunk_size > len(data):
             return data
-        for j in range(chunk_size):
-            data[pos] = (data[pos] >> 4) | ((data[pos] & 0x0F) << 4)
-            pos += 1
+        data[pos:pos+chunk_size] = bytes(data[pos:pos+chunk_size]).translate(_NIBBLE_SWAP)
+        pos += chunk_size
     return data
 
 def main():
@@ -133,21 +162,23 @@ def main():
         print("Input file must be a .pac file")
         sys.exit(1)
 
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
 
-    entries = try_open(input_file)
-    if entries is None:
+    opened = try_open(input_file)
+    if opened is None:
         print("Failed to open the PAC file")
         sys.exit(1)
 
-    view = ArcView(input_file)
-    for entry in entries:
-        output_path = os.path.join(output_dir, entry.name)
-        with open(output_path, 'wb') as out_file:
-            data = open_entry(view, entry)
-            out_file.write(data)
-        print(f"Extracted: {entry.name}")
+    view, entries = opened
+    with contextlib.closing(view):
+        for entry in entries:
+            output_path = os.path.join(output_dir, entry.name)
+            with open(output_path, 'wb', buffering=1 << 20) as out_file:
+                if entry.type == "script":
+                    out_file.write(open_entry(view, entry))
+                else:
+                    view.copy_to(entry.offset, entry.size, out_file)
+            print(f"Extracted: {entry.name}")
 
     print("Extraction complete")
 
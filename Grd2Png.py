@@ -1,8 +1,72 @@
 import argparse
+import heapq
 import os
 import struct
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
 from PIL import Image
-import io
+
+_U32 = struct.Struct("<I")
+# Format, screen w/h, bpp, crop box (l/r/t/b), then the four channel sizes.
+_HDR = struct.Struct("<8H4I")
+
+try:
+    from numba import njit
+    _HAVE_NUMBA = True
+except ImportError:
+    _HAVE_NUMBA = False
+
+if _HAVE_NUMBA:
+    @njit(cache=True, nogil=True)
+    def _rle_decode(src, dst):
+        s = 0
+        d = 0
+        n = src.shape[0]
+        while s < n:
+            count = src[s]
+            s += 1
+            if count > 0x7F:
+                count &= 0x7F
+                v = src[s]
+                s += 1
+                dst[d:d+count] = v
+                d += count
+            elif count > 0:
+                dst[d:d+count] = src[s:s+count]
+                s += count
+                d += count
+
+    @njit(cache=True, nogil=True)
+    def _lz77_decode(src, dst):
+        special = src[8]
+        s = 12
+        d = 0
+        n = dst.shape[0]
+        while d < n:
+            b = src[s]
+            s += 1
+            if b == special:
+                offset = src[s]
+                s += 1
+                if offset != special:
+                    count = src[s]
+                    s += 1
+                    if offset > special:
+                        offset -= 1
+                    if count <= offset <= d:
+                        # non-overlapping: one memcpy-style slice copy
+                        dst[d:d+count] = dst[d-offset:d-offset+count]
+                        d += count
+                    else:
+                        for i in range(count):
+                            dst[d] = dst[d - offset]
+                            d += 1
+                else:
+                    dst[d] = offset
+                    d += 1
+            else:
+                dst[d] = b
+                d += 1
 
 class GrdMetaData:
     def __init__(self):
@@ -22,54 +86,91 @@ class GrdReader:
         self.input = input_stream
         self.info = info
         self.output = bytearray(info.Width * info.Height * (info.BPP // 8))
-        self.channel = bytearray(info.Width * info.Height)
         self.pack_type = info.Format >> 8
         self.pixel_size = info.BPP // 8
+        # (H, W, C) view over the output buffer; channel decodes scatter
+        # into it and convert_grd_to_png hands it to Pillow as-is.
+        self.output_np = np.frombuffer(self.output, dtype=np.uint8).reshape(
+            info.Height, info.Width, self.pixel_size)
+        # Bind the decode pipeline for this file's pack type once, instead
+        # of re-branching on it for every channel.
+        self._decode = {
+            0x01: self.decode_rle,
+            0xA1: self._decode_huff_rle,
+            0xA2: self._decode_huff_lz77,
+        }[self.pack_type]
 
     def unpack(self):
+        layout = []
         next_pos = 0x20
         if self.info.BPP == 32 and self.info.AlphaSize > 0:
-            self.unpack_channel(3, next_pos, self.info.AlphaSize)
+            layout.append((3, next_pos, self.info.AlphaSize))
             next_pos += self.info.AlphaSize
-        self.unpack_channel(0, next_pos, self.info.RSize)  # Red channel
+        layout.append((0, next_pos, self.info.RSize))  # Red channel
         next_pos += self.info.RSize
-        self.unpack_channel(1, next_pos, self.info.GSize)  # Green channel
+        layout.append((1, next_pos, self.info.GSize))  # Green channel
         next_pos += self.info.GSize
-        self.unpack_channel(2, next_pos, self.info.BSize)  # Blue channel
+        layout.append((2, next_pos, self.info.BSize))  # Blue channel
+
+        jobs = []
+        for dst, src_pos, src_size in layout:
+            self.input.seek(src_pos)
+            jobs.append((dst, self.input.read(src_size)))
+
+        # Channels are independent; the numba decoders run with
+        # nogil=True, so they overlap on a thread pool.
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [(dst, executor.submit(self.decode_channel, data))
+                       for dst, data in jobs]
+            decoded = [(dst, future.result()) for dst, future in futures]
 
-    def unpack_channel(self, dst, src_pos, src_size):
-        self.input.seek(src_pos)
+        for dst, channel in decoded:
+            ch = np.frombuffer(channel, dtype=np.uint8).reshape(
+                self.info.Height, self.info.Width)
+            self.output_np[:, :, dst] = ch[::-1, :]
 
-        if self.pack_type == 1:
-            self.unpack_rle(self.input, src_size)
+    def decode_channel(self, data):
+        channel = bytearray(self.info.Width * self.info.Height)
+        self._decode(data, channel)
+        return channel
+
+    def _decode_huff_rle(self, data, channel):
+        self.decode_rle(self.unpack_huffman(data), channel)
+
+    def _decode_huff_lz77(self, data, channel):
+        self.decode_lz77(self.unpack_huffman(data), channel)
+
+    @staticmethod
+    def decode_rle(src, channel):
+        if _HAVE_NUMBA:
+            _rle_decode(np.frombuffer(src, dtype=np.uint8),
+                        np.frombuffer(channel, dtype=np.uint8))
         else:
-            data = self.unpack_huffman(self.input)
-            if self.pack_type == 0xA2:
-                self.unpack_lz77(data, self.channel)
-            else:
-                self.unpack_rle(io.BytesIO(data), len(data))
+            GrdReader.unpack_rle(src, len(src), channel)
 
-        for y in range(self.info.Height - 1, -1, -1):
-            src = y * self.info.Width
-            for x in range(self.info.Width):
-                self.output[dst] = self.channel[src]
-                src += 1
-                dst += self.pixel_size
+    @staticmethod
+    def decode_lz77(src, channel):
+        if _HAVE_NUMBA:
+            _lz77_decode(np.frombuffer(src, dtype=np.uint8),
+                         np.frombuffer(channel, dtype=np.uint8))
+        else:
+            GrdReader.unpack_lz77(src, channel)
 
-    def unpack_rle(self, input_stream, src_size):
+    @staticmethod
+    def unpack_rle(input_data, src_size, output):
         src = 0
         dst = 0
         while src < src_size:
-            count = input_stream.read(1)[0]
+            count = input_data[src]
             src += 1
             if count > 0x7F:
                 count &= 0x7F
-                v = input_stream.read(1)[0]
+                v = input_data[src]
                 src += 1
-                self.channel[dst:dst+count] = [v] * count
+                output[dst:dst+count] = v.to_bytes(1, 'little') * count
                 dst += count
             elif count > 0:
-                self.channel[dst:dst+count] = input_stream.read(count)
+                output[dst:dst+count] = input_data[src:src+count]
                 src += count
                 dst += count
 
@@ -89,9 +190,14 @@ class GrdReader:
                     src += 1
                     if offset > special:
                         offset -= 1
-                    for i in range(count):
-                        output[dst] = output[dst - offset]
-                        dst += 1
+                    if count <= offset <= dst:
+                        # non-overlapping: one memcpy-style slice copy
+                        output[dst:dst+count] = output[dst-offset:dst-offset+count]
+                        dst += count
+                    else:
+                        for i in range(count):
+                            output[dst] = output[dst - offset]
+                            dst += 1
                 else:
                     output[dst] = offset
                     dst += 1
@@ -99,94 +205,105 @@ class GrdReader:
                 output[dst] = b
                 dst += 1
 
-    def unpack_huffman(self, input_stream):
-        tree = self.create_huffman_tree(input_stream)
-        unpacked = bytearray(self.huffman_unpacked)
-        bits = LsbBitStream(input_stream)
+    @staticmethod
+    def unpack_huffman(data):
+        unpacked_size, packed_size = struct.unpack_from('<II', data, 0)
+        freqs = struct.unpack_from('<256I', data, 8)
+        left, right = GrdReader.create_huffman_tree(freqs)
+        table = GrdReader.build_decode_table(left, right)
+        payload = data[0x408:0x408 + packed_size]
+        unpacked = bytearray(unpacked_size)
+        end = len(payload)
+        bit_buf = 0
+        nbits = 0
+        pos = 0
         dst = 0
-        while dst < self.huffman_unpacked:
-            node = 0x1FE
+        while dst < unpacked_size:
+            if nbits < 32:
+                if pos + 4 <= end:
+                    bit_buf |= _U32.unpack_from(payload, pos)[0] << nbits
+                else:
+                    bit_buf |= int.from_bytes(payload[pos:end], 'little') << nbits
+                pos += 4
+                nbits += 32
+            node, used = table[bit_buf & 0xFF]
+            bit_buf >>= used
+            nbits -= used
             while node > 0xFF:
-                if bits.get_next_bit() != 0:
-                    node = tree[node].right
+                if nbits <= 0:
+                    bit_buf = int.from_bytes(payload[pos:pos+4], 'little')
+                    pos += 4
+                    nbits = 32
+                if bit_buf & 1:
+                    node = right[node]
                 else:
-                    node = tree[node].left
+                    node = left[node]
+                bit_buf >>= 1
+                nbits -= 1
             unpacked[dst] = node
             dst += 1
         return unpacked
 
-    def create_huffman_tree(self, input_stream):
-        nodes = [HuffmanNode() for _ in range(0x200)]
-        tree = []
-        self.huffman_unpacked = struct.unpack('<I', input_stream.read(4))[0]
-        input_stream.read(4)  # packed_size
+    @staticmethod
+    def build_decode_table(left, right, k=8):
+        # table[prefix] = (leaf symbol, code length) for codes of at most
+        # k bits, or (internal node, k) when the code continues past the
+        # prefix and the tree walk resumes from that node.
+        table = []
+        for prefix in range(1 << k):
+            node = 0x1FE
+            used = 0
+            while used < k and node > 0xFF:
+                if (prefix >> used) & 1:
+                    node = right[node]
+                else:
+                    node = left[node]
+                used += 1
+            table.append((int(node), used))
+        return table
 
-        for i in range(0x100):
-            nodes[i].freq = struct.unpack('<I', input_stream.read(4))[0]
-            self.add_node(tree, nodes, i)
+    @staticmethod
+    def create_huffman_tree(freqs):
+        # Per-call arrays so concurrent channel decodes don't share state.
+        left = np.zeros(0x200, dtype=np.int32)
+        right = np.zeros(0x200, dtype=np.int32)
+
+        # (freq, index) pairs; the monotonically assigned index doubles as
+        # the tiebreaker, matching the old FIFO ordering among equal freqs.
+        heap = [(f, i) for i, f in enumerate(freqs)]
+        heapq.heapify(heap)
 
         last_node = 0x100
-        while len(tree) > 1:
-            l = tree.pop(0)
-            r = tree.pop(0)
-            nodes[last_node].freq = nodes[l].freq + nodes[r].freq
-            nodes[last_node].left = l
-            nodes[last_node].right = r
-            self.add_node(tree, nodes, last_node)
+        while len(heap) > 1:
+            l_freq, l = heapq.heappop(heap)
+            r_freq, r = heapq.heappop(heap)
+            left[last_node] = l
+            right[last_node] = r
+            heapq.heappush(heap, (l_freq + r_freq, last_node))
             last_node += 1
 
-        return nodes
-
-    @staticmethod
-    def add_node(tree, nodes, index):
-        freq = nodes[index].freq
-        for i, node in enumerate(tree):
-            if nodes[node].freq > freq:
-                tree.insert(i, index)
-                return
-        tree.append(index)
-
-class HuffmanNode:
-    def __init__(self):
-        self.freq = 0
-        self.left = 0
-        self.right = 0
-
-class LsbBitStream:
-    def __init__(self, stream):
-        self.stream = stream
-        self.current_byte = 0
-        self.bit_position = 8
-
-    def get_next_bit(self):
-        if self.bit_position == 8:
-            self.current_byte = self.stream.read(1)[0]
-            self.bit_position = 0
-        bit = self.current_byte & 1
-        self.current_byte >>= 1
-        self.bit_position += 1
-        return bit
+        return left, right
 
 def read_grd_metadata(file_path):
     with open(file_path, 'rb') as f:
         header = f.read(0x20)
-        if header[0] not in (1, 2) or header[1] not in (1, 0xA1, 0xA2):
+        if len(header) < _HDR.size:
+            return None
+        (fmt, screen_width, screen_height, bpp, left, right, top, bottom,
+         alpha_size, r_size, g_size, b_size) = _HDR.unpack(header)
+        if (fmt & 0xFF) not in (1, 2) or (fmt >> 8) not in (1, 0xA1, 0xA2):
             return None
-        bpp = struct.unpack('<H', header[6:8])[0]
         if bpp not in (24, 32):
             return None
 
-        screen_width, screen_height = struct.unpack('<HH', header[2:6])
-        left, right, top, bottom = struct.unpack('<HHHH', header[8:16])
-
         info = GrdMetaData()
-        info.Format = struct.unpack('<H', header[:2])[0]
+        info.Format = fmt
         info.Width = abs(right - left)
         info.Height = abs(bottom - top)
         info.BPP = bpp
         info.OffsetX = left
         info.OffsetY = screen_height - bottom
-        info.AlphaSize, info.RSize, info.GSize, info.BSize = struct.unpack('<IIII', header[0x10:0x20])
+        info.AlphaSize, info.RSize, info.GSize, info.BSize = alpha_size, r_size, g_size, b_size
 
         file_size = os.path.getsize(file_path)
         if 0x20 + info.AlphaSize + info.RSize + info.BSize + info.GSize != file_size:
@@ -194,7 +311,7 @@ def read_grd_metadata(file_path):
 
         return info
 
-def convert_grd_to_png(input_path, output_path):
+def convert_grd_to_png(input_path, output_path, fast=False):
     info = read_grd_metadata(input_path)
     if info is None:
         print(f"Invalid GRD file: {input_path}")
@@ -204,40 +321,53 @@ def convert_grd_to_png(input_path, output_path):
         reader = GrdReader(f, info)
         reader.unpack()
 
-    if info.BPP == 24:
-        mode = 'RGB'
-    elif info.AlphaSize > 0:
-        mode = 'RGBA'
-    else:
-        mode = 'RGB'
+    arr = reader.output_np
+    if reader.pixel_size == 4 and info.AlphaSize == 0:
+        arr = arr[:, :, :3]  # stored with a pad byte but no alpha plane
 
-    image = Image.frombytes(mode, (info.Width, info.Height), bytes(reader.output))
-    image.save(output_path, 'PNG')
+    image = Image.fromarray(arr)
+    # zlib level 1 trades ~15-25% larger files for a much cheaper encode.
+    image.save(output_path, 'PNG', compress_level=1 if fast else 6,
+               optimize=False)
 
-def process_directory(input_dir, output_dir):
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def process_directory(input_dir, output_dir, fast=False):
+    os.makedirs(output_dir, exist_ok=True)
 
+    pairs = []
+    seen_dirs = set()
     for root, _, files in os.walk(input_dir):
         for file in files:
             if file.lower().endswith('.grd'):
                 input_path = os.path.join(root, file)
                 relative_path = os.path.relpath(input_path, input_dir)
                 output_path = os.path.join(output_dir, os.path.splitext(relative_path)[0] + '.png')
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                convert_grd_to_png(input_path, output_path)
-                print(f"Converted: {input_path} -> {output_path}")
+                parent = os.path.dirname(output_path)
+                if parent not in seen_dirs:
+                    os.makedirs(parent, exist_ok=True)
+                    seen_dirs.add(parent)
+                pairs.append((input_path, output_path))
+
+    # Conversions are independent and CPU-bound, so fan out one per core.
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = {executor.submit(convert_grd_to_png, i, o, fast): (i, o)
+                   for i, o in pairs}
+        for future in as_completed(futures):
+            input_path, output_path = futures[future]
+            future.result()
+            print(f"Converted: {input_path} -> {output_path}")
 
 def main():
     parser = argparse.ArgumentParser(description="Convert GRD files to PNG")
     parser.add_argument("input", help="Input GRD file or directory")
     parser.add_argument("output", help="Output PNG file or directory")
+    parser.add_argument("--fast", action="store_true",
+                        help="Encode PNGs at zlib level 1 (faster, larger files)")
     args = parser.parse_args()
 
     if os.path.isdir(args.input):
-        process_directory(args.input, args.output)
+        process_directory(args.input, args.output, fast=args.fast)
     else:
-        convert_grd_to_png(args.input, args.output)
+        convert_grd_to_png(args.input, args.output, fast=args.fast)
 
 if __name__ == "__main__":
     main()